@@ -0,0 +1,139 @@
+# benchmarks/conftest.py
+"""Seeded pomodoro.db fixtures for the query benchmarks.
+
+Each size is generated once into benchmarks/.data (or POMODORO_BENCH_DATA)
+and reused by later runs. Sizes are picked with --bench-sizes, e.g.
+--bench-sizes=1000,100000,10000000.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+DATA_DIR = os.environ.get(
+    "POMODORO_BENCH_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+)
+os.makedirs(DATA_DIR, exist_ok=True)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main migrates its database on import, keep that away from the real pomodoro.db,
+# and the timer journal off
+os.environ.setdefault(
+    "POMODORO_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="pomodoro-bench-"), "pomodoro.db")
+)
+os.environ.setdefault("POMODORO_TIMER_JOURNAL", "")
+
+import main  # noqa: E402
+
+SEED = 1234
+TASKS = 300
+INACTIVE_TASKS = 30
+HISTORY_DAYS = 730
+BATCH = 100_000
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-sizes",
+        default="1000,100000",
+        help="comma separated pomodoro counts of the seeded databases (up to 10000000)",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "seeded_db" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("bench_sizes").split(",")]
+        metafunc.parametrize("seeded_db", sizes, indirect=True, ids=[f"size={size}" for size in sizes], scope="session")
+
+
+def generate(path, size):
+    """Write size pomodoros spread over HISTORY_DAYS ending today"""
+    engine = create_engine(f"sqlite:///{path}")
+    main.Base.metadata.create_all(engine)
+    # Indexes are built after the bulk insert, which is much faster
+    for index in main.Pomodoro.__table__.indexes:
+        index.drop(engine, checkfirst=True)
+    engine.dispose()
+
+    rng = random.Random(SEED)
+    now = datetime.utcnow()
+    start = now - timedelta(days=HISTORY_DAYS)
+    span = int((now - start).total_seconds())
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO tasks (id, name, target_pomodoros, color, is_active, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (task_id, f"Task {task_id}", rng.randint(1, 8), "#d95550", task_id > INACTIVE_TASKS, str(start))
+            for task_id in range(1, TASKS + 1)
+        ],
+    )
+    for offset in range(0, size, BATCH):
+        conn.executemany(
+            "INSERT INTO pomodoros (task_id, completed_at, duration) VALUES (?, ?, ?)",
+            [
+                (
+                    rng.randint(1, TASKS),
+                    (start + timedelta(seconds=rng.randrange(span))).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                    25,
+                )
+                for _ in range(min(BATCH, size - offset))
+            ],
+        )
+    conn.commit()
+    conn.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    for index in main.Pomodoro.__table__.indexes:
+        index.create(engine)
+    with sessionmaker(bind=engine)() as db:
+        main.rebuild_daily_stats(db)
+        db.commit()
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def seeded_db(request):
+    size = request.param
+    path = os.path.join(DATA_DIR, f"pomodoro-{size}-{SEED}.db")
+    if not os.path.exists(path):
+        # Generated under a temporary name so an interrupted run is redone
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        generate(path + ".tmp", size)
+        os.replace(path + ".tmp", path)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", main.apply_sqlite_profile)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def reset_caches():
+    main.task_cache = main.TaskListCache()
+    main.stats_cache = main.StatsRangeCache(main.STATS_CACHE_SIZE, main.STATS_TODAY_TTL)
+
+
+@pytest.fixture
+def client(seeded_db):
+    from fastapi.testclient import TestClient
+
+    def get_db():
+        db = seeded_db()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_db] = get_db
+    reset_caches()
+    with TestClient(main.app) as client:
+        yield client
+    main.app.dependency_overrides.clear()
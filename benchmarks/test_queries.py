@@ -0,0 +1,68 @@
+# benchmarks/test_queries.py
+"""Task and stats reads over the seeded histories.
+
+"cold" rounds start with empty in-process caches so they time the queries
+themselves, "warm" rounds time the cached path.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+import main
+from conftest import reset_caches
+
+COLD_ROUNDS = 20
+
+
+def last_full_month():
+    first = date.today().replace(day=1) - timedelta(days=1)
+    return first.year, first.month
+
+
+def run(benchmark, client, url, cache):
+    def get():
+        response = client.get(url)
+        assert response.status_code == 200
+        return response
+
+    if cache == "cold":
+        return benchmark.pedantic(get, setup=reset_caches, rounds=COLD_ROUNDS)
+    get()
+    return benchmark(get)
+
+
+@pytest.mark.parametrize("cache", ["cold", "warm"])
+def test_read_tasks(benchmark, client, cache):
+    response = run(benchmark, client, "/api/tasks/?limit=1000", cache)
+    assert len(response.json()) == 270
+
+
+def test_task_response_with_stats(benchmark, seeded_db):
+    with seeded_db() as db:
+        task = benchmark(main.task_response_with_stats, 150, db)
+    assert task["id"] == 150
+
+
+@pytest.mark.parametrize("cache", ["cold", "warm"])
+def test_get_daily_stats_week(benchmark, client, cache):
+    end = date.today() - timedelta(days=7)
+    start = end - timedelta(days=6)
+    response = run(benchmark, client, f"/api/stats/daily/?start_date={start}&end_date={end}", cache)
+    assert len(response.json()) == 7
+
+
+@pytest.mark.parametrize("cache", ["cold", "warm"])
+def test_get_monthly_stats(benchmark, client, cache):
+    year, month = last_full_month()
+    run(benchmark, client, f"/api/stats/monthly/?year={year}&month={month}", cache)
+
+
+def test_get_monthly_stats_year(benchmark, client):
+    # Twelve months as loaded by a dashboard, with empty caches
+    year = date.today().year - 1
+
+    def load_year():
+        for month in range(1, 13):
+            assert client.get(f"/api/stats/monthly/?year={year}&month={month}").status_code == 200
+
+    benchmark.pedantic(load_year, setup=reset_caches, rounds=COLD_ROUNDS)
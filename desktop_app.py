@@ -2,6 +2,8 @@
 import asyncio
 import aiohttp
 import json
+import math
+import struct
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
@@ -13,10 +15,51 @@ from pystray import MenuItem as item, Icon as icon
 from PIL import Image, ImageDraw
 import sys
 
+# Двоичный timer_update (TIMER_FRAME в main.py): версия, флаги, событие,
+# затем time_left, work_duration, break_duration, current_task_id и
+# миллисекунды до дедлайна
+TIMER_FRAME = struct.Struct("<BBBxIIIII")
+FRAME_EVENTS = [None, "start", "pause", "skip", "settings", "task"]
+
+def decode_timer_frame(frame):
+    """Сообщение timer_update из двоичного кадра, None для неизвестного формата"""
+    if len(frame) < TIMER_FRAME.size or frame[0] != 1:
+        return None
+    _, flags, event, time_left, work_duration, break_duration, task_id, remaining_ms = \
+        TIMER_FRAME.unpack_from(frame)
+    is_running = bool(flags & 1)
+    now = time.time()
+    return {
+        "type": "timer_update",
+        "event": FRAME_EVENTS[event] if event < len(FRAME_EVENTS) else None,
+        "data": {
+            "is_running": is_running,
+            "is_work_time": bool(flags & 2),
+            "time_left": time_left,
+            "work_duration": work_duration,
+            "break_duration": break_duration,
+            "current_task_id": task_id if flags & 4 else None,
+            "server_time": now,
+            "deadline": now + remaining_ms / 1000 if is_running else None,
+        },
+    }
+
 class PomodoroDesktopApp:
     def __init__(self):
         self.api_base = "http://localhost:8000/api"
+        # Подписка на изменения таймера; protocol=2 присылает только переходы,
+        # format=binary - timer_update в двоичных кадрах (decode_timer_frame)
+        self.ws_url = "ws://localhost:8000/ws?protocol=2&format=binary"
+        # Паузы между попытками переподключения (секунды), пока сокет
+        # недоступен состояние опрашивается по HTTP раз в poll_interval
+        self.reconnect_delay_min = 1
+        self.reconnect_delay_max = 30
+        self.poll_interval = 1
+        # Список задач не приходит по сокету, перечитываем его изредка
+        self.tasks_refresh_interval = 60
         self.session = None
+        # ETag и последний ответ для каждого GET запроса
+        self.etag_cache = {}
         self.tasks = []
         self.current_task_id = None
         self.timer_state = {
@@ -27,6 +70,9 @@ class PomodoroDesktopApp:
             "break_duration": 300,
             "current_task_id": None
         }
+        # Локальный дедлайн (time.monotonic), до которого идет отсчет
+        self.local_deadline = None
+        self.server_state = None
         self.root = None
         self.tray_icon = None
         self.is_running = True
@@ -71,9 +117,20 @@ class PomodoroDesktopApp:
             url = f"{self.api_base}{endpoint}"
             
             if method == "GET":
-                async with self.session.get(url) as response:
+                # Условный запрос: при 304 сервер ничего не пересылает
+                headers = {}
+                cached = self.etag_cache.get(url)
+                if cached:
+                    headers["If-None-Match"] = cached[0]
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached:
+                        return cached[1]
                     if response.status == 200:
-                        return await response.json()
+                        data = await response.json()
+                        etag = response.headers.get("ETag")
+                        if etag:
+                            self.etag_cache[url] = (etag, data)
+                        return data
                     else:
                         print(f"API error: {response.status}")
                         return None
@@ -121,12 +178,44 @@ class PomodoroDesktopApp:
         try:
             state = await self.api_request("/timer/")
             if state:
-                self.timer_state.update(state)
+                # Неизмененное состояние (304) не пересчитываем, иначе
+                # отсчет начнется заново со старого server_time
+                if state is not self.server_state:
+                    # Сокет недоступен и timer_complete не придет: работавший
+                    # таймер, дошедший до нуля и остановленный, - завершение
+                    completed = (
+                        self.timer_state["is_running"]
+                        and not state.get("is_running")
+                        and self.current_time_left() <= 1
+                    )
+                    completed_work = self.timer_state["is_work_time"]
+                    self.server_state = state
+                    self.apply_timer_state(state)
+                    if completed:
+                        self.notify_completion(completed_work)
                 return True
         except Exception as e:
             print(f"Failed to load timer state: {e}")
         return False
 
+    def apply_timer_state(self, state):
+        """Применение состояния с сервера и пересчет локального дедлайна"""
+        self.timer_state.update(state)
+        if state.get("is_running"):
+            if state.get("deadline") is not None:
+                remaining = state["deadline"] - state["server_time"]
+            else:
+                remaining = state["time_left"]
+            self.local_deadline = time.monotonic() + remaining
+        else:
+            self.local_deadline = None
+
+    def current_time_left(self):
+        """Оставшееся время, отсчитываемое локально"""
+        if self.local_deadline is None:
+            return self.timer_state["time_left"]
+        return max(0, math.ceil(self.local_deadline - time.monotonic()))
+
     async def start_timer(self):
         """Запуск таймера"""
         await self.api_request("/timer/start/", "POST")
@@ -324,8 +413,9 @@ class PomodoroDesktopApp:
 
     def update_timer_display(self):
         """Обновление отображения таймера"""
-        minutes = self.timer_state["time_left"] // 60
-        seconds = self.timer_state["time_left"] % 60
+        time_left = self.current_time_left()
+        minutes = time_left // 60
+        seconds = time_left % 60
         self.timer_label.config(text=f"{minutes:02d}:{seconds:02d}")
         
         # Обновление режима
@@ -391,42 +481,101 @@ class PomodoroDesktopApp:
         asyncio.create_task(self.load_tasks())
 
     async def timer_loop(self):
-        """Основной цикл таймера"""
+        """Основной цикл: подписка на /ws, опрос по HTTP только пока сокет недоступен"""
+        delay = self.reconnect_delay_min
         while self.is_running:
             try:
-                # Загружаем состояние с сервера
-                await self.load_timer_state()
-                await self.load_tasks()
-                
-                # Обновляем UI в главном потоке
-                if self.root:
-                    self.root.after(0, self.update_timer_display)
-                    self.root.after(0, self.update_tasks_display)
-                
-                # Проверяем завершение таймера
-                if self.timer_state["time_left"] == 0 and self.timer_state["is_running"]:
-                    if self.timer_state["is_work_time"]:
-                        # Завершение работы
-                        self.show_notification("Помидор завершен!", "Время отдохнуть!", "work")
-                        # Добавляем помидор к задаче
-                        if self.timer_state.get("current_task_id"):
-                            await self.add_pomodoro(self.timer_state["current_task_id"], 
-                                                   self.timer_state["work_duration"] // 60)
-                    else:
-                        # Завершение перерыва
-                        self.show_notification("Перерыв завершен!", "Время работать!", "break")
-                
-                await asyncio.sleep(1)
-                
+                await self.listen_websocket()
+                # Соединение было установлено, переподключаемся быстро
+                delay = self.reconnect_delay_min
             except Exception as e:
-                print(f"Timer loop error: {e}")
-                await asyncio.sleep(5)  # Ждем 5 секунд при ошибке
+                print(f"WebSocket недоступен: {e}")
+
+            # До следующей попытки работаем через опрос
+            retry_at = time.monotonic() + delay
+            while self.is_running and time.monotonic() < retry_at:
+                await self.poll_server()
+                await asyncio.sleep(self.poll_interval)
+            delay = min(delay * 2, self.reconnect_delay_max)
+
+    async def listen_websocket(self):
+        """Получение состояния таймера через WebSocket"""
+        await self.init_session()
+        async with self.session.ws_connect(self.ws_url, heartbeat=30) as ws:
+            await self.load_tasks()
+            self.schedule_ui(self.update_tasks_display)
+            while self.is_running:
+                try:
+                    msg = await ws.receive(timeout=self.tasks_refresh_interval)
+                except asyncio.TimeoutError:
+                    if await self.load_tasks():
+                        self.schedule_ui(self.update_tasks_display)
+                    continue
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    await self.handle_message(json.loads(msg.data))
+                elif msg.type == aiohttp.WSMsgType.BINARY:
+                    message = decode_timer_frame(msg.data)
+                    if message:
+                        await self.handle_message(message)
+                elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+
+    async def handle_message(self, message):
+        """Обработка сообщения сервера"""
+        message_type = message.get("type")
+        if message_type == "initial_state":
+            state = message.get("timer")
+        else:
+            state = message.get("data")
+        if state:
+            self.server_state = state
+            self.apply_timer_state(state)
+            self.schedule_ui(self.update_timer_display)
+
+        if message_type == "timer_complete":
+            # Помидор записывает сам сервер
+            self.notify_completion(message.get("is_work_time"))
+        elif message_type == "pomodoro_recorded":
+            # Сервер сохранил помидор, счетчики completed_today изменились
+            if await self.load_tasks():
+                self.schedule_ui(self.update_tasks_display)
+
+    def notify_completion(self, completed_work):
+        """Уведомление о завершении помидора или перерыва"""
+        if completed_work:
+            self.schedule_ui(lambda: self.show_notification("Помидор завершен!", "Время отдохнуть!", "work"))
+        else:
+            self.schedule_ui(lambda: self.show_notification("Перерыв завершен!", "Время работать!", "break"))
+
+    async def poll_server(self):
+        """Загрузка состояния по HTTP, пока сокет недоступен"""
+        try:
+            await self.load_timer_state()
+            await self.load_tasks()
+            self.schedule_ui(self.update_timer_display)
+            self.schedule_ui(self.update_tasks_display)
+        except Exception as e:
+            print(f"Timer loop error: {e}")
+
+    def schedule_ui(self, callback):
+        """Выполнение callback в потоке Tk"""
+        if self.root:
+            self.root.after(0, callback)
+
+    def tick_display(self):
+        """Локальный отсчет времени раз в секунду, без запросов к серверу"""
+        if not self.is_running:
+            return
+        self.update_timer_display()
+        self.root.after(1000, self.tick_display)
 
     def run(self):
         """Запуск приложения"""
         # Создаем главное окно
         self.create_main_window()
         
+        self.root.after(1000, self.tick_display)
+        
         # Создаем иконку в трее
         tray_icon = self.create_tray_icon()
         
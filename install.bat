@@ -24,10 +24,12 @@ if errorlevel 1 (
     pip install fastapi
     pip install uvicorn[standard]
     pip install sqlalchemy
+    pip install aiosqlite
     pip install aiohttp
     pip install pystray
     pip install Pillow
     pip install websockets
+    pip install qasync
 )
 
 echo.
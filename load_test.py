@@ -0,0 +1,374 @@
+# load_test.py
+"""Нагрузочный тест REST API и рассылки /ws.
+
+Запускает сервер (в этом же процессе или отдельным процессом uvicorn) на
+временной базе, подключает N WebSocket клиентов и M REST клиентов, которые
+опрашивают /api/timer/ и /api/tasks/, и выполняет команды таймера и вставки
+помидоров в заданной пропорции. В конце печатает p50/p95/p99 задержки
+доставки сообщений таймера и запросов, запросы в секунду и CPU/RSS сервера.
+
+Примеры:
+    python load_test.py --ws-clients 500 --pollers 20 --duration 30
+    python load_test.py --server uvicorn --protocol 1 --rooms 10 --json before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ACTIONS = ["start", "pause", "skip", "set_task", "pomodoro"]
+
+
+def parse_mix(value):
+    """Разбор пропорций команд вида start=1,pause=1,pomodoro=2"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"неизвестная команда: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentiles(values):
+    """p50/p95/p99 в миллисекундах"""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+    return {"count": len(values), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class ProcessSampler:
+    """CPU и RSS процесса сервера, через psutil или /proc"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.process = psutil.Process(pid) if psutil else None
+        self.rss_max = 0
+        self.start_cpu = None
+        self.start_time = None
+
+    def cpu_seconds(self):
+        if self.process:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except OSError:
+            return None
+
+    def rss(self):
+        if self.process:
+            return self.process.memory_info().rss
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    def start(self):
+        self.start_cpu = self.cpu_seconds()
+        self.start_time = time.monotonic()
+
+    def sample(self):
+        rss = self.rss()
+        if rss:
+            self.rss_max = max(self.rss_max, rss)
+
+    def report(self):
+        end_cpu = self.cpu_seconds()
+        if end_cpu is None or self.start_cpu is None:
+            return {"cpu_percent": None, "rss_max_mb": None}
+        elapsed = time.monotonic() - self.start_time
+        return {
+            "cpu_percent": round((end_cpu - self.start_cpu) / elapsed * 100, 1),
+            "rss_max_mb": round(self.rss_max / 1024 / 1024, 1) if self.rss_max else None,
+        }
+
+
+def start_server_in_process(port, db_dir):
+    """Сервер в потоке этого процесса; CPU/RSS включают и клиентов"""
+    import uvicorn
+
+    os.chdir(db_dir)
+    sys.path.insert(0, REPO_DIR)
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    def stop():
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    return os.getpid(), stop
+
+
+def start_server_uvicorn(port, db_dir):
+    """Сервер отдельным процессом uvicorn"""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=db_dir,
+        env=env,
+    )
+
+    def stop():
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    return process.pid, stop
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base = f"http://127.0.0.1:{args.port}"
+        self.rooms = [f"load-{i}" for i in range(args.rooms)]
+        self.task_ids = []
+        # Задержки по видам запросов и сообщений, в секундах
+        self.latencies = {}
+        self.errors = {}
+        self.ws_messages = 0
+        self.connected = 0
+        self.running = True
+
+    def record(self, name, seconds):
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def error(self, name):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    async def request(self, session, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with session.request(method, self.base + path, **kwargs) as response:
+                await response.read()
+                if response.status >= 400:
+                    self.error(name)
+                self.record(name, time.perf_counter() - started)
+                return response
+        except Exception:
+            self.error(name)
+            return None
+
+    async def wait_ready(self, session, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(self.base + "/api/tasks/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError("сервер не запустился")
+
+    async def setup(self, session):
+        for i in range(self.args.tasks):
+            async with session.post(self.base + "/api/tasks/", json={"name": f"load {i}"}) as response:
+                self.task_ids.append((await response.json())["id"])
+
+    async def ws_client(self, session, index, connected):
+        room = self.rooms[index % len(self.rooms)]
+        url = f"{self.base}/ws?protocol={self.args.protocol}&room={room}"
+        released = False
+        try:
+            async with session.ws_connect(url) as ws:
+                self.connected += 1
+                # Первый клиент комнаты задает короткие длительности, чтобы
+                # таймеры завершались во время теста
+                if index < len(self.rooms):
+                    await ws.send_json({
+                        "type": "update_settings",
+                        "work_duration": self.args.work_seconds,
+                        "break_duration": self.args.break_seconds,
+                    })
+                connected.release()
+                released = True
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    received = time.time()
+                    message = json.loads(msg.data)
+                    self.ws_messages += 1
+                    state = message.get("timer") or message.get("data")
+                    if state and "server_time" in state and message.get("type") != "initial_state":
+                        name = "ws_tick" if message.get("type") == "timer_update" and "event" not in message else "ws_" + message["type"]
+                        self.record(name, received - state["server_time"])
+                    if not self.running:
+                        break
+        except Exception:
+            self.error("ws")
+            if not released:
+                connected.release()
+
+    async def poller(self, session, index):
+        room = self.rooms[index % len(self.rooms)]
+        etags = {}
+        while self.running:
+            for name, path in (("GET /api/timer/", f"/api/timer/?room={room}"), ("GET /api/tasks/", "/api/tasks/")):
+                headers = {"If-None-Match": etags[path]} if self.args.etag and path in etags else {}
+                response = await self.request(session, name, "GET", path, headers=headers)
+                if response is not None and "ETag" in response.headers:
+                    etags[path] = response.headers["ETag"]
+            await asyncio.sleep(self.args.poll_interval)
+
+    async def driver(self, session):
+        mix = self.args.mix
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        interval = 1 / self.args.rate if self.args.rate > 0 else None
+        while self.running and interval:
+            action = random.choices(names, weights)[0]
+            room = random.choice(self.rooms)
+            if action == "pomodoro":
+                await self.request(session, "POST /api/pomodoros/", "POST", "/api/pomodoros/",
+                                   json={"task_id": random.choice(self.task_ids), "duration": 25})
+            elif action == "set_task":
+                task_id = random.choice(self.task_ids)
+                await self.request(session, "PUT /api/timer/task/", "PUT", f"/api/timer/task/{task_id}?room={room}")
+            else:
+                await self.request(session, f"POST /api/timer/{action}/", "POST", f"/api/timer/{action}/?room={room}")
+            await asyncio.sleep(interval)
+
+    async def run(self, sampler):
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await self.wait_ready(session)
+            await self.setup(session)
+
+            # Подключаем клиентов порциями, не больше 100 рукопожатий сразу
+            connected = asyncio.Semaphore(100)
+            clients = []
+            for i in range(self.args.ws_clients):
+                await connected.acquire()
+                clients.append(asyncio.create_task(self.ws_client(session, i, connected)))
+            for _ in range(100):
+                await connected.acquire()
+            # Сообщения, пришедшие во время подключения, не учитываем
+            self.latencies.clear()
+            self.ws_messages = 0
+            print(f"Подключено WebSocket клиентов: {self.connected}")
+
+            sampler.start()
+            started = time.monotonic()
+            workers = [asyncio.create_task(self.poller(session, i)) for i in range(self.args.pollers)]
+            workers.append(asyncio.create_task(self.driver(session)))
+            while time.monotonic() - started < self.args.duration:
+                sampler.sample()
+                await asyncio.sleep(0.5)
+            elapsed = time.monotonic() - started
+            self.running = False
+            for task in workers + clients:
+                task.cancel()
+            await asyncio.gather(*workers, *clients, return_exceptions=True)
+            return elapsed
+
+    def report(self, elapsed, server):
+        requests = sum(len(v) for k, v in self.latencies.items() if not k.startswith("ws_"))
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "json"},
+            "duration": round(elapsed, 2),
+            "ws_clients_connected": self.connected,
+            "ws_messages": self.ws_messages,
+            "ws_messages_per_second": round(self.ws_messages / elapsed, 1),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 1),
+            "latency_ms": {name: percentiles(values) for name, values in sorted(self.latencies.items())},
+            "errors": self.errors,
+            "server": server,
+        }
+
+
+def print_report(report):
+    print("=" * 60)
+    print(f"Длительность: {report['duration']} с")
+    print(f"WebSocket: {report['ws_clients_connected']} клиентов, "
+          f"{report['ws_messages']} сообщений ({report['ws_messages_per_second']}/с)")
+    print(f"REST: {report['requests']} запросов ({report['requests_per_second']}/с)")
+    print(f"{'':28}{'кол-во':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}")
+    for name, stats in report["latency_ms"].items():
+        print(f"{name:28}{stats['count']:>8}{stats.get('p50', '-'):>10}{stats.get('p95', '-'):>10}{stats.get('p99', '-'):>10}")
+    if report["errors"]:
+        print(f"Ошибки: {report['errors']}")
+    server = report["server"]
+    print(f"Сервер: CPU {server['cpu_percent']}%, RSS до {server['rss_max_mb']} МБ"
+          + (" (вместе с клиентами)" if report["config"]["server"] == "inprocess" else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Pomodoro сервера")
+    parser.add_argument("--server", choices=["inprocess", "uvicorn"], default="inprocess",
+                        help="inprocess - сервер в этом процессе, uvicorn - отдельный процесс")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ws-clients", type=int, default=100, help="число WebSocket клиентов")
+    parser.add_argument("--protocol", type=int, default=2, help="1 - тики каждую секунду, 2 - только переходы")
+    parser.add_argument("--rooms", type=int, default=1, help="клиенты распределяются по комнатам")
+    parser.add_argument("--pollers", type=int, default=10, help="число REST клиентов")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="пауза REST клиента, секунды")
+    parser.add_argument("--no-etag", dest="etag", action="store_false", help="не отправлять If-None-Match")
+    parser.add_argument("--rate", type=float, default=5.0, help="команд в секунду")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("start=2,pause=1,skip=1,set_task=1,pomodoro=2"),
+                        help="пропорции команд, например start=2,pause=1,skip=1,set_task=1,pomodoro=2")
+    parser.add_argument("--tasks", type=int, default=5, help="число задач для set_task и помидоров")
+    parser.add_argument("--work-seconds", type=int, default=5)
+    parser.add_argument("--break-seconds", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=30.0, help="секунды измерения")
+    parser.add_argument("--db-dir", help="каталог для pomodoro.db, по умолчанию временный")
+    parser.add_argument("--json", help="сохранить результаты в JSON файл")
+    args = parser.parse_args()
+
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix="pomodoro-load-")
+    os.makedirs(db_dir, exist_ok=True)
+    start = start_server_in_process if args.server == "inprocess" else start_server_uvicorn
+    pid, stop = start(args.port, db_dir)
+    sampler = ProcessSampler(pid)
+
+    print(f"🚀 Нагрузочный тест: сервер {args.server}, база в {db_dir}")
+    load_test = LoadTest(args)
+    try:
+        elapsed = asyncio.run(load_test.run(sampler))
+        report = load_test.report(elapsed, sampler.report())
+    finally:
+        stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,129 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, ConfigDict
 from typing import List, Optional, Dict, Any
 from datetime import date, datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey
+from collections import OrderedDict, deque
+from sqlalchemy import create_engine, event, Column, Integer, String, Date, DateTime, Boolean, ForeignKey, Index, func, and_, insert, select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, Session, relationship
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import asyncio
+import bisect
+import contextvars
+import gzip
+import hashlib
+import heapq
+import itertools
+import logging
+import math
 import os
 import json
+import sqlite3
+import struct
+import threading
+import time
+import uuid
 
-# SQLite database URL
-DATABASE_URL = "sqlite:///./pomodoro.db"
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("pomodoro")
+
+# SQLite database URL, POMODORO_DATABASE_URL points the server at another file
+DATABASE_URL = os.environ.get("POMODORO_DATABASE_URL", "sqlite:///./pomodoro.db")
+# Same database through aiosqlite, for code running on the event loop
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# Pragmas applied to every new SQLite connection, picked with
+# POMODORO_SQLITE_PROFILE
+SQLITE_PROFILES = {
+    # WAL lets stats reads run next to pomodoro writes, and commits are only
+    # fsynced at checkpoints
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # in KiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms
+    },
+    # WAL, but every commit is fsynced
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # SQLite defaults
+    "default": {},
+}
+SQLITE_PROFILE = os.environ.get("POMODORO_SQLITE_PROFILE", "wal")
+if SQLITE_PROFILE not in SQLITE_PROFILES:
+    raise RuntimeError(f"Unknown POMODORO_SQLITE_PROFILE: {SQLITE_PROFILE}")
+
+# Connections kept per engine, and extra ones allowed under bursts
+DB_POOL_SIZE = int(os.environ.get("POMODORO_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("POMODORO_DB_MAX_OVERFLOW", "20"))
+
+# Write-behind batching of pomodoro inserts, disabled when POMODORO_BATCH_MS is 0
+POMODORO_BATCH_MS = int(os.environ.get("POMODORO_BATCH_MS", "0"))
+POMODORO_BATCH_ROWS = int(os.environ.get("POMODORO_BATCH_ROWS", "100"))
+
+# Where timer state and events live: "local" keeps them in this process,
+# "sqlite" shares them between worker processes through POMODORO_BUS_PATH
+TIMER_BACKEND = os.environ.get("POMODORO_TIMER_BACKEND", "local")
+if TIMER_BACKEND not in ("local", "sqlite"):
+    raise RuntimeError(f"Unknown POMODORO_TIMER_BACKEND: {TIMER_BACKEND}")
+BUS_PATH = os.environ.get("POMODORO_BUS_PATH", "pomodoro-bus.db")
+# How often (in ms) workers look for events from the others
+BUS_POLL_MS = int(os.environ.get("POMODORO_BUS_POLL_MS", "20"))
+# Append-only log of timer changes for the local backend, replayed at
+# startup so that running timers survive restarts; empty disables it. It is
+# folded into a snapshot every TIMER_SNAPSHOT_EVERY records.
+TIMER_JOURNAL = os.environ.get("POMODORO_TIMER_JOURNAL", "pomodoro-timers.log")
+TIMER_SNAPSHOT_EVERY = int(os.environ.get("POMODORO_TIMER_SNAPSHOT_EVERY", "1000"))
+# Worker processes started by `python main.py`, more than one needs the
+# sqlite backend
+WORKERS = int(os.environ.get("POMODORO_WORKERS", "1"))
+
+# Number of stats ranges kept in memory, and how long (in seconds) a range
+# reaching today is served before it is read again
+STATS_CACHE_SIZE = int(os.environ.get("POMODORO_STATS_CACHE_SIZE", "256"))
+STATS_TODAY_TTL = float(os.environ.get("POMODORO_STATS_TODAY_TTL", "5"))
+
+# Encoder of API responses and WebSocket messages: the standard "json" module,
+# or "orjson" which needs the orjson package
+JSON_ENCODER = os.environ.get("POMODORO_JSON_ENCODER", "json")
+if JSON_ENCODER not in ("json", "orjson"):
+    raise RuntimeError(f"Unknown POMODORO_JSON_ENCODER: {JSON_ENCODER}")
+if JSON_ENCODER == "orjson" and orjson is None:
+    raise RuntimeError("POMODORO_JSON_ENCODER=orjson needs the orjson package")
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        # Dates serialize natively and stats are keyed by day
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+if JSON_ENCODER == "orjson":
+    APIResponse = ORJSONResponse
+
+    def dumps(message) -> str:
+        return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    APIResponse = JSONResponse
+    dumps = json.dumps
 
 # Create database and tables
 Base = declarative_base()
@@ -38,6 +147,24 @@ class Pomodoro(Base):
     duration = Column(Integer, default=25)
     task = relationship("Task", back_populates="pomodoros")
 
+    __table_args__ = (
+        # Date range scans for the stats endpoints
+        Index("ix_pomodoros_completed_at", "completed_at"),
+        # Per-task "completed today" lookups
+        Index("ix_pomodoros_task_id_completed_at", "task_id", "completed_at"),
+    )
+
+class DailyTaskStats(Base):
+    # Per day and task rollup of pomodoros, kept in sync by record_pomodoro()
+    __tablename__ = "daily_task_stats"
+    day = Column(Date, primary_key=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Integer, nullable=False, default=0)
+
+    # Clustered on (day, task_id) so date ranges are a primary key range scan
+    __table_args__ = {"sqlite_with_rowid": False}
+
 # Pydantic models
 class TaskCreate(BaseModel):
     name: str
@@ -68,106 +195,1250 @@ class TimerState:
     def __init__(self):
         self.is_running = False
         self.is_work_time = True
-        self.time_left = 1500  # 25 minutes in seconds
-        self.work_duration = 1500
+        self.work_duration = 1500  # 25 minutes in seconds
         self.break_duration = 300
         self.current_task_id = None
+        # While paused the remaining time is stored as is; while running it is
+        # derived from a monotonic deadline so it never drifts
+        self.remaining = float(self.work_duration)
+        self.started_at = None
+        self.deadline = None
+        # Called whenever the schedule changes, set by the owning Room
+        self.on_change = None
+        # Bumped on every change, used as the ETag of /api/timer/
+        self.version = 0
+
+    @property
+    def time_left(self):
+        if self.is_running:
+            return max(0, math.ceil(self.deadline - time.monotonic()))
+        return math.ceil(self.remaining)
+
+    def start(self):
+        if self.is_running:
+            return
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + self.remaining
+        self.is_running = True
+        self.notify()
+
+    def pause(self):
+        if not self.is_running:
+            return
+        self.remaining = max(0.0, self.deadline - time.monotonic())
+        self.is_running = False
+        self.started_at = None
+        self.deadline = None
+        self.notify()
+
+    def reset(self, is_work_time):
+        # Stop and load the full duration of the given mode
+        self.is_running = False
+        self.is_work_time = is_work_time
+        self.remaining = float(self.work_duration if is_work_time else self.break_duration)
+        self.started_at = None
+        self.deadline = None
+        self.notify()
+
+    def skip(self):
+        self.reset(not self.is_work_time)
+
+    def update_settings(self, work_duration, break_duration):
+        self.work_duration = work_duration
+        self.break_duration = break_duration
+        self.remaining = float(work_duration if self.is_work_time else break_duration)
+        if self.is_running:
+            self.started_at = time.monotonic()
+            self.deadline = self.started_at + self.remaining
+        self.notify()
+
+    def notify(self):
+        self.version += 1
+        if self.on_change:
+            self.on_change()
+
+    def set_task(self, task_id):
+        self.current_task_id = task_id
+        self.notify()
+
+    def snapshot(self):
+        # Full state with the deadline in wall-clock seconds, so that it can
+        # be restored in another process
+        deadline = None
+        if self.is_running:
+            deadline = time.time() + (self.deadline - time.monotonic())
+        return {
+            "is_running": self.is_running,
+            "is_work_time": self.is_work_time,
+            "work_duration": self.work_duration,
+            "break_duration": self.break_duration,
+            "current_task_id": self.current_task_id,
+            "remaining": self.remaining,
+            "deadline": deadline,
+            "version": self.version
+        }
+
+    def restore(self, snapshot):
+        self.is_running = snapshot["is_running"]
+        self.is_work_time = snapshot["is_work_time"]
+        self.work_duration = snapshot["work_duration"]
+        self.break_duration = snapshot["break_duration"]
+        self.current_task_id = snapshot["current_task_id"]
+        self.remaining = snapshot["remaining"]
+        if snapshot["deadline"] is not None:
+            self.started_at = time.monotonic()
+            self.deadline = self.started_at + (snapshot["deadline"] - time.time())
+        else:
+            self.started_at = None
+            self.deadline = None
+        # Not bumped: the version travels with the state
+        self.version = snapshot["version"]
+        if self.on_change:
+            self.on_change()
 
     def to_dict(self):
+        # server_time and deadline are wall-clock seconds so that clients can
+        # count down locally: time_left = deadline - (now + server_time - received_at)
+        server_time = time.time()
+        deadline = None
+        if self.is_running:
+            deadline = server_time + (self.deadline - time.monotonic())
         return {
             "is_running": self.is_running,
             "is_work_time": self.is_work_time,
             "time_left": self.time_left,
             "work_duration": self.work_duration,
             "break_duration": self.break_duration,
-            "current_task_id": self.current_task_id
+            "current_task_id": self.current_task_id,
+            "server_time": server_time,
+            "deadline": deadline
         }
 
 # Create database engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-Base.metadata.create_all(bind=engine)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW
+)
+
+def apply_sqlite_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in SQLITE_PROFILES[SQLITE_PROFILE].items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+event.listen(engine, "connect", apply_sqlite_profile)
 
 # Session local
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Global state for timer
-timer_state = TimerState()
-active_connections = []
+# Async engine and sessions, so that database work never blocks the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW
+)
+event.listen(async_engine.sync_engine, "connect", apply_sqlite_profile)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Metrics, exposed in the Prometheus text format at /metrics. Observations
+# are a bisect and two increments, cheap enough to keep on everywhere
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        # Label values -> [per-bucket counts, +Inf count, sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [(label_values, list(values)) for label_values, values in self.series.items()]
+        for label_values, values in series:
+            labels = "".join(f'{name}="{value}",' for name, value in zip(self.labels, label_values))
+            total = 0
+            for bound, count in zip(self.buckets + [math.inf], values):
+                total += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}le="{le}"}} {total}')
+            suffix = "{" + labels.rstrip(",") + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-1]}")
+            lines.append(f"{self.name}_count{suffix} {total}")
+        return lines
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+class CallbackMetric:
+    # Read from a callback when scraped, so nothing is tracked in between
+    def __init__(self, name, documentation, read, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.kind = kind
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", f"{self.name} {self.read()}"]
+
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+timer_loop_lag = Histogram(
+    "pomodoro_timer_loop_lag_seconds",
+    "Delay between a scheduled timer wake-up and timer_background_task handling it",
+    LATENCY_BUCKETS,
+)
+broadcast_duration = Histogram(
+    "pomodoro_broadcast_duration_seconds",
+    "Time to encode a room broadcast and queue it for every client",
+    [0.00005, 0.0001, 0.00025] + LATENCY_BUCKETS[:8],
+)
+ws_send_failures = Counter(
+    "pomodoro_ws_send_failures_total",
+    "WebSocket clients dropped because a send failed or their queue overflowed",
+    ("reason",),
+)
+db_query_duration = Histogram(
+    "pomodoro_db_query_duration_seconds",
+    "SQL statement latency by the route that issued it",
+    LATENCY_BUCKETS,
+    ("endpoint",),
+)
+http_request_duration = Histogram(
+    "pomodoro_http_request_duration_seconds",
+    "HTTP request latency by route",
+    LATENCY_BUCKETS,
+    ("method", "route", "status"),
+)
+
+# ASGI scope of the HTTP request being handled, to label its queries
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+def route_label(scope):
+    route = scope.get("route") if scope else None
+    return route.path if route else "unmatched"
+
+def query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+def query_finished(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        scope = current_scope.get()
+        db_query_duration.observe(
+            time.perf_counter() - context.query_started,
+            route_label(scope) if scope else "background",
+        )
+
+for metered_engine in (engine, async_engine.sync_engine):
+    event.listen(metered_engine, "before_cursor_execute", query_started)
+    event.listen(metered_engine, "after_cursor_execute", query_finished)
+
+class MetricsMiddleware:
+    # Plain ASGI middleware timing HTTP requests per matched route
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        token = current_scope.set(scope)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_scope.reset(token)
+            http_request_duration.observe(
+                time.perf_counter() - started, scope["method"], route_label(scope), status
+            )
+
+def migrate_database():
+    Base.metadata.create_all(bind=engine)
+
+    # create_all() skips tables that already exist, so indexes added to the
+    # models later are created here for existing pomodoro.db files
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # Existing databases get their rollup filled from the pomodoro history.
+    # Decided by the contents rather than by the table being new, so that a
+    # retry after a failed rebuild still fills it.
+    db = SessionLocal()
+    try:
+        rollup_empty = db.query(DailyTaskStats.day).first() is None
+        if rollup_empty and db.query(Pomodoro.id).filter(Pomodoro.task_id.is_not(None)).first() is not None:
+            rebuild_daily_stats(db)
+    finally:
+        db.close()
+
+def record_pomodoro(db: Session, task_id: int, duration: int) -> Pomodoro:
+    # Add a pomodoro and its rollup row in the caller's transaction
+    completed_at = datetime.utcnow()
+    db_pomodoro = Pomodoro(task_id=task_id, duration=duration, completed_at=completed_at)
+    db.add(db_pomodoro)
+    db.execute(sqlite_insert(DailyTaskStats).values(
+        day=completed_at.date(),
+        task_id=task_id,
+        count=1,
+        total_minutes=duration
+    ).on_conflict_do_update(
+        index_elements=[DailyTaskStats.day, DailyTaskStats.task_id],
+        set_={
+            "count": DailyTaskStats.count + 1,
+            "total_minutes": DailyTaskStats.total_minutes + duration
+        }
+    ))
+    return db_pomodoro
+
+def rebuild_daily_stats(db: Session) -> int:
+    # Recompute the whole rollup from the pomodoros table
+    day = func.date(Pomodoro.completed_at)
+    db.execute(delete(DailyTaskStats))
+    db.execute(insert(DailyTaskStats).from_select(
+        ["day", "task_id", "count", "total_minutes"],
+        select(
+            day,
+            Pomodoro.task_id,
+            func.count(Pomodoro.id),
+            func.coalesce(func.sum(Pomodoro.duration), 0)
+        ).where(Pomodoro.task_id.is_not(None)).group_by(day, Pomodoro.task_id)
+    ))
+    db.commit()
+    return db.query(DailyTaskStats).count()
+
+# Workers started together race to create missing tables, the loser retries
+for attempt in range(3):
+    try:
+        migrate_database()
+        break
+    except OperationalError:
+        if attempt == 2:
+            raise
+        time.sleep(0.5)
+
+class TaskListCache:
+    # Active tasks with their completed_today counts, loaded once per local
+    # day and patched by every commit that changes them, so the task list is
+    # served without a query. version is bumped with each change and is the
+    # ETag of /api/tasks/
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = None
+        self.day = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session) -> List[Dict[str, Any]]:
+        today = datetime.now().date()
+        with self.lock:
+            if self.tasks is not None and self.day == today:
+                self.hits += 1
+                return list(self.tasks.values())
+            self.misses += 1
+            version = self.version
+        rows = tasks_with_stats_query(db).filter(Task.is_active == True).all()
+        tasks = {row.id: dict(row._mapping) for row in rows}
+        with self.lock:
+            # A write that committed while we were reading may be missing
+            # from the rows, keep them out of the cache in that case
+            if self.version == version:
+                self.tasks = tasks
+                self.day = today
+        return list(tasks.values())
+
+    def put_task(self, task: Dict[str, Any]):
+        # Called with the fresh row after a task is created or updated
+        with self.lock:
+            self.version += 1
+            if self.tasks is None:
+                return
+            tasks = {k: v for k, v in self.tasks.items() if k != task["id"]}
+            if task["is_active"]:
+                tasks[task["id"]] = task
+            self.tasks = dict(sorted(tasks.items()))
+
+    def remove_task(self, task_id: int):
+        with self.lock:
+            self.version += 1
+            if self.tasks is not None and task_id in self.tasks:
+                self.tasks = {k: v for k, v in self.tasks.items() if k != task_id}
+
+    def add_pomodoros(self, pomodoros: List[Pomodoro]):
+        # Count committed pomodoros into completed_today with the same cut-off
+        # as tasks_with_stats_query
+        with self.lock:
+            self.version += 1
+            if self.tasks is None:
+                return
+            day_start = datetime.combine(self.day, datetime.min.time())
+            tasks = dict(self.tasks)
+            for pomodoro in pomodoros:
+                task = tasks.get(pomodoro.task_id)
+                if task is not None and pomodoro.completed_at >= day_start:
+                    tasks[pomodoro.task_id] = {**task, "completed_today": task["completed_today"] + 1}
+            self.tasks = tasks
+
+    def invalidate(self):
+        # Drop the list, for changes made by another worker process
+        with self.lock:
+            self.version += 1
+            self.tasks = None
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "version": self.version}
+
+task_cache = TaskListCache()
+
+class StatsRangeCache:
+    # LRU of /api/stats/ results keyed by (start_date, end_date). Past days
+    # only change when a pomodoro is stored for them, which drops the ranges
+    # containing that day; ranges reaching today also expire after today_ttl
+    # in case the database was written by another process
+    def __init__(self, max_entries, today_ttl):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.today_ttl = today_ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, start_date: date, end_date: date, load) -> Dict[str, Any]:
+        key = (start_date, end_date)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.generation
+        result = load()
+        # Rollup days are UTC dates, a range is live if it reaches either today
+        today = min(datetime.now().date(), datetime.utcnow().date())
+        expires_at = time.monotonic() + self.today_ttl if end_date >= today else None
+        with self.lock:
+            if self.max_entries > 0 and self.generation == generation:
+                self.entries[key] = (result, expires_at)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return result
+
+    def invalidate_days(self, days):
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.entries if any(key[0] <= day <= key[1] for day in days)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+stats_cache = StatsRangeCache(STATS_CACHE_SIZE, STATS_TODAY_TTL)
+
+def pomodoros_committed(pomodoros: List[Pomodoro]):
+    # Bring the caches up to date with pomodoros that were just committed
+    days = {pomodoro.completed_at.date() for pomodoro in pomodoros}
+    task_cache.add_pomodoros(pomodoros)
+    stats_cache.invalidate_days(days)
+    timer_backend.data_changed(stats_days=days)
+
+def record_pomodoros(db: Session, rows) -> List[Pomodoro]:
+    pomodoros = [record_pomodoro(db, task_id, duration) for task_id, duration in rows]
+    db.flush()
+    return pomodoros
+
+class PomodoroWriter:
+    # Write-behind queue: pomodoros added within batch_ms of each other (or
+    # until batch_rows are waiting) are inserted in one transaction, so a
+    # single fsync covers the whole batch
+    def __init__(self, batch_ms, batch_rows):
+        self.batch_seconds = batch_ms / 1000
+        self.batch_rows = batch_rows
+        self.pending = []
+        self.has_pending = None
+        self.is_full = None
+        self.closing = False
+        self.task = None
+
+    def start(self):
+        # The events bind to the serving loop, so each lifespan gets its own
+        self.has_pending = asyncio.Event()
+        self.is_full = asyncio.Event()
+        self.closing = False
+        self.task = asyncio.create_task(self.run())
+
+    async def add(self, task_id, duration) -> Pomodoro:
+        # Resolves with the stored row, id included, once its batch commits
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((task_id, duration, future))
+        self.has_pending.set()
+        if len(self.pending) >= self.batch_rows:
+            self.is_full.set()
+        return await future
+
+    async def run(self):
+        while not self.closing:
+            await self.has_pending.wait()
+            try:
+                await asyncio.wait_for(self.is_full.wait(), timeout=self.batch_seconds)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        self.has_pending.clear()
+        self.is_full.clear()
+        if not batch:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                pomodoros = await db.run_sync(
+                    record_pomodoros, [(task_id, duration) for task_id, duration, _ in batch]
+                )
+                await db.commit()
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        pomodoros_committed(pomodoros)
+        for (_, _, future), db_pomodoro in zip(batch, pomodoros):
+            if not future.done():
+                future.set_result(db_pomodoro)
+
+    async def stop(self):
+        # Let the running batch finish instead of cancelling it mid-commit,
+        # then write whatever is still queued
+        self.closing = True
+        self.has_pending.set()
+        self.is_full.set()
+        if self.task:
+            await self.task
+            self.task = None
+        await self.flush()
+
+pomodoro_writer = PomodoroWriter(POMODORO_BATCH_MS, POMODORO_BATCH_ROWS) if POMODORO_BATCH_MS > 0 else None
+
+async def save_pomodoro(task_id: int, duration: int) -> Pomodoro:
+    # Insert a pomodoro from the event loop, batched when write-behind is on
+    if pomodoro_writer:
+        return await pomodoro_writer.add(task_id, duration)
+    async with AsyncSessionLocal() as db:
+        db_pomodoro = await db.run_sync(record_pomodoro, task_id, duration)
+        await db.commit()
+    pomodoros_committed([db_pomodoro])
+    return db_pomodoro
+
+# Pomodoro writes started by timer completions, finished before shutdown
+background_saves = set()
+
+def record_completed_pomodoro(room_id, task_id, duration):
+    # The timer loop does not wait for the database: the row is written in
+    # its own task, in the same batch as other rooms' completions when
+    # write-behind is on, and the room learns about it with a
+    # pomodoro_recorded message once it is committed
+    async def save():
+        try:
+            db_pomodoro = await save_pomodoro(task_id, duration)
+        except Exception:
+            logger.exception("Failed to save the pomodoro of room %s", room_id)
+            return
+        await timer_backend.announce(room_id, {
+            "type": "pomodoro_recorded",
+            "task_id": task_id,
+            "pomodoro_id": db_pomodoro.id
+        })
+    task = asyncio.create_task(save())
+    background_saves.add(task)
+    task.add_done_callback(background_saves.discard)
 
-# Background task for timer
+# Room used by clients that do not ask for one
+DEFAULT_ROOM = "default"
+
+class Room:
+    # An independent timer together with the clients watching it
+    def __init__(self, room_id):
+        self.id = room_id
+        self.timer = TimerState()
+        self.timer.on_change = lambda: schedule_timer(self)
+        self.connections = set()
+        # Monotonic time of this room's live entry in timer_heap
+        self.wake_at = None
+
+    def has_legacy_clients(self):
+        return any(client.protocol == LEGACY_PROTOCOL for client in self.connections)
+
+# Global state for timers
+rooms = {}
+active_connections = set()
+
+async def get_room(room_id=DEFAULT_ROOM):
+    room = rooms.get(room_id)
+    if room is None:
+        # The backend may already hold state for it, e.g. from another worker
+        state = await timer_backend.load_state(room_id)
+        # Another request may have created the room in the meantime
+        room = rooms.get(room_id)
+        if room is None:
+            room = rooms[room_id] = Room(room_id)
+            if state is not None:
+                room.timer.restore(state)
+    return room
+
+def release_room(room):
+    # Rooms are only kept while in use: watched by a client, running, or
+    # holding state the backend could not give back when asked again
+    if (
+        room.id != DEFAULT_ROOM
+        and not room.connections
+        and not room.timer.is_running
+        and (timer_backend.keeps_state or room.timer.version == 0)
+        and rooms.get(room.id) is room
+    ):
+        del rooms[room.id]
+
+# Seconds a single client may take to accept a frame before it is dropped
+SEND_TIMEOUT = 5.0
+# Messages a client may have waiting before it is considered stuck
+MAX_PENDING_MESSAGES = 64
+# Full-state messages where only the most recent one matters
+COALESCED_MESSAGES = {"timer_update"}
+
+# WebSocket protocol versions, negotiated with /ws?protocol=N.
+# 1 pushes a timer_update every second while the timer runs,
+# 2 only pushes transitions and clients count down from the deadline.
+LEGACY_PROTOCOL = 1
+TRANSITIONS_PROTOCOL = 2
+PROTOCOL_VERSION = TRANSITIONS_PROTOCOL
+
+# timer_update messages can instead be sent as binary frames, asked for with
+# /ws?format=binary; every other message stays JSON text. A frame is, little
+# endian: frame version, flags, event, padding, then time_left, work_duration,
+# break_duration, current_task_id (0 for none) and the milliseconds left until
+# the deadline as unsigned 32-bit integers.
+BINARY_FRAME_VERSION = 1
+TIMER_FRAME = struct.Struct("<BBBxIIIII")
+FRAME_RUNNING = 1
+FRAME_WORK_TIME = 2
+FRAME_HAS_TASK = 4
+# Event codes, by position; 0 is a tick without an event
+FRAME_EVENTS = [None, "start", "pause", "skip", "settings", "task"]
+UINT32_MAX = 2 ** 32 - 1
+
+def encode_timer_frame(message):
+    state = message["data"]
+    flags = 0
+    if state["is_running"]:
+        flags |= FRAME_RUNNING
+    if state["is_work_time"]:
+        flags |= FRAME_WORK_TIME
+    task_id = state["current_task_id"]
+    if isinstance(task_id, int) and 0 < task_id <= UINT32_MAX:
+        flags |= FRAME_HAS_TASK
+    else:
+        task_id = 0
+    remaining_ms = 0
+    if state["deadline"] is not None:
+        remaining_ms = round((state["deadline"] - state["server_time"]) * 1000)
+    event = message.get("event")
+    return TIMER_FRAME.pack(
+        BINARY_FRAME_VERSION,
+        flags,
+        FRAME_EVENTS.index(event) if event in FRAME_EVENTS else 0,
+        *(min(max(int(value), 0), UINT32_MAX) for value in (
+            state["time_left"], state["work_duration"], state["break_duration"], task_id, remaining_ms
+        ))
+    )
+
+def encode_message(message, binary=False):
+    if binary and message["type"] == "timer_update":
+        return encode_timer_frame(message)
+    return dumps(message)
+
+class ClientConnection:
+    # Outbound side of one WebSocket: a bounded queue drained by its own
+    # writer task, so slow clients never apply backpressure to the timer
+    def __init__(self, websocket, room, protocol=LEGACY_PROTOCOL, binary=False):
+        self.websocket = websocket
+        self.room = room
+        self.protocol = protocol
+        self.binary = binary
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.writer = asyncio.create_task(self.write_loop())
+
+    def enqueue(self, message_type, payload):
+        if self.closed:
+            return
+        if message_type in COALESCED_MESSAGES:
+            # Drop superseded state, the newest one is appended below
+            self.pending = deque(
+                item for item in self.pending if item[0] != message_type
+            )
+        self.pending.append((message_type, payload))
+        if len(self.pending) > MAX_PENDING_MESSAGES:
+            # Discrete events are never dropped, a client that cannot keep
+            # up with them is disconnected instead
+            ws_send_failures.inc("queue_full")
+            self.close()
+            return
+        self.ready.set()
+
+    async def write_loop(self):
+        try:
+            while True:
+                while not self.pending:
+                    self.ready.clear()
+                    await self.ready.wait()
+                _, payload = self.pending.popleft()
+                if isinstance(payload, bytes):
+                    send = self.websocket.send_bytes(payload)
+                else:
+                    send = self.websocket.send_text(payload)
+                await asyncio.wait_for(send, timeout=SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Evict stalled or disconnected clients
+            if not self.closed:
+                ws_send_failures.inc("send_error")
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.clear()
+        active_connections.discard(self)
+        self.room.connections.discard(self)
+        release_room(self.room)
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        asyncio.create_task(close_connection(self.websocket))
+
+async def close_connection(websocket):
+    try:
+        await asyncio.wait_for(websocket.close(code=1011), timeout=SEND_TIMEOUT)
+    except Exception:
+        pass
+
+def send_message(client, message):
+    client.enqueue(message["type"], encode_message(message, client.binary))
+
+async def broadcast(room, message, protocol=None):
+    # Encode once per frame format and hand the same frame to the queue of
+    # every client in the room, optionally only to clients speaking the given
+    # protocol version
+    if not room.connections:
+        return
+    started = time.perf_counter()
+    payloads = {}
+    for client in list(room.connections):
+        if protocol is None or client.protocol == protocol:
+            payload = payloads.get(client.binary)
+            if payload is None:
+                payload = payloads[client.binary] = encode_message(message, client.binary)
+            client.enqueue(message["type"], payload)
+    broadcast_duration.observe(time.perf_counter() - started)
+
+def transition(event, command):
+    # Timer change that runs command and announces it as a timer_update
+    def change(timer):
+        command(timer)
+        return [{
+            "type": "timer_update",
+            "event": event,
+            "data": timer.to_dict()
+        }]
+    return change
+
+async def update_timer(room, change):
+    # Every timer change goes through the backend: change(timer) mutates the
+    # timer and returns the messages to broadcast for it
+    messages = await timer_backend.update(room, change)
+    release_room(room)
+    return messages
+
+def apply_data_changed(message):
+    # Another worker changed tasks or pomodoros, drop what it touched
+    task_cache.invalidate()
+    if message["days"] is None:
+        stats_cache.clear()
+    else:
+        stats_cache.invalidate_days({date.fromisoformat(day) for day in message["days"]})
+
+class TimerJournal:
+    # Every change appends the room's snapshot to an append-only log; every
+    # snapshot_every records the latest state of all rooms is written to a
+    # snapshot file and the log starts over. Replay reads the snapshot and
+    # then the log, keeping the highest version seen for each room.
+    def __init__(self, path, snapshot_every):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.snapshot_every = snapshot_every
+        self.states = {}
+        self.records = 0
+        self.file = None
+
+    def replay(self):
+        states = {}
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                states = json.load(f)
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last write of a crashed process
+                        break
+                    current = states.get(record["room"])
+                    if current is None or record["state"]["version"] >= current["version"]:
+                        states[record["room"]] = record["state"]
+        except FileNotFoundError:
+            pass
+        self.states = states
+        return states
+
+    def append(self, room_id, event, state):
+        self.states[room_id] = state
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps({"room": room_id, "event": event, "state": state}) + "\n")
+        # Handed to the OS, which keeps it across a crash of the process
+        self.file.flush()
+        self.records += 1
+        if self.records >= self.snapshot_every:
+            self.compact()
+
+    def compact(self):
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.states, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.records = 0
+
+    def close(self):
+        self.compact()
+        self.file.close()
+        self.file = None
+
+class LocalTimerBackend:
+    # Single process: changes apply to the room's timer in place and are
+    # journaled when a journal is configured
+    def __init__(self, journal=None):
+        self.journal = journal
+        # Released rooms come back from the journal's latest states
+        self.keeps_state = journal is not None
+
+    async def load_state(self, room_id):
+        if self.journal:
+            return self.journal.states.get(room_id)
+        return None
+
+    async def update(self, room, change):
+        messages = change(room.timer)
+        if messages and self.journal:
+            self.journal.append(room.id, messages[0].get("event", messages[0]["type"]), room.timer.snapshot())
+        for message in messages:
+            await broadcast(room, message)
+        return messages
+
+    async def announce(self, room_id, message):
+        room = rooms.get(room_id)
+        if room is not None:
+            await broadcast(room, message)
+
+    def data_changed(self, stats_days=(), all_stats=False):
+        pass
+
+    async def start(self):
+        if self.journal:
+            # Running timers resume against their wall-clock deadlines; ones
+            # that expired while the server was down complete right away
+            for room_id, state in self.journal.replay().items():
+                room = await get_room(room_id)
+                room.timer.restore(state)
+                release_room(room)
+            # Start from a clean log: appending after a torn last line would
+            # join the next record to it, and replay stops there
+            self.journal.compact()
+
+    async def stop(self):
+        if self.journal:
+            self.journal.close()
+
+class SQLiteTimerBackend:
+    # Timer state shared by several worker processes through a small SQLite
+    # database. Changes are read-modify-write in BEGIN IMMEDIATE transactions
+    # that append the resulting messages to timer_events; every worker tails
+    # that log, only querying it when PRAGMA data_version reports a commit,
+    # and broadcasts the messages to its own clients in log order.
+    keeps_state = True
+
+    def __init__(self, path, poll_interval):
+        self.path = path
+        self.poll_interval = poll_interval
+        # Tags data_changed events so a worker skips its own
+        self.origin = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.writer = None
+        self.reader = None
+        self.data_version = None
+        self.last_seq = 0
+        self.pruned_at = time.monotonic()
+        self.outbox = []
+        self.wakeup = None
+        self.loop = None
+        self.task = None
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def open(self):
+        if self.writer is not None:
+            return
+        self.writer = self.connect()
+        self.writer.execute(
+            "CREATE TABLE IF NOT EXISTS timer_rooms (room TEXT PRIMARY KEY, state TEXT NOT NULL)"
+        )
+        self.writer.execute(
+            "CREATE TABLE IF NOT EXISTS timer_events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, room TEXT, origin TEXT NOT NULL, "
+            "state TEXT, message TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.reader = self.connect()
+        # Only events from now on are delivered, state comes from timer_rooms
+        self.last_seq = self.reader.execute("SELECT COALESCE(MAX(seq), 0) FROM timer_events").fetchone()[0]
+
+    def read_state(self, room_id):
+        # Runs in a worker thread, the lock may be held by a transaction
+        # waiting on another worker's
+        with self.lock:
+            row = self.writer.execute("SELECT state FROM timer_rooms WHERE room = ?", (room_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def load_state(self, room_id):
+        self.open()
+        return await asyncio.to_thread(self.read_state, room_id)
+
+    def transact(self, room_id, change):
+        # Runs in a worker thread; change() sees the latest committed state
+        with self.lock:
+            conn = self.writer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT state FROM timer_rooms WHERE room = ?", (room_id,)).fetchone()
+                timer = TimerState()
+                if row:
+                    timer.restore(json.loads(row[0]))
+                messages = change(timer)
+                snapshot = timer.snapshot()
+                if messages:
+                    state = json.dumps(snapshot)
+                    conn.execute("INSERT OR REPLACE INTO timer_rooms (room, state) VALUES (?, ?)", (room_id, state))
+                    conn.executemany(
+                        "INSERT INTO timer_events (room, origin, state, message, created_at) VALUES (?, ?, ?, ?, ?)",
+                        [(room_id, self.origin, state, json.dumps(message), time.time()) for message in messages]
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return snapshot, messages
+
+    async def update(self, room, change):
+        snapshot, messages = await asyncio.to_thread(self.transact, room.id, change)
+        # Visible to this worker's requests right away, the messages reach
+        # its clients through the event log like everyone else's
+        if snapshot["version"] > room.timer.version:
+            room.timer.restore(snapshot)
+        if messages:
+            self.wakeup.set()
+        return messages
+
+    def data_changed(self, stats_days=(), all_stats=False):
+        # May be called from the threadpool running sync endpoints
+        if self.loop is None:
+            return
+        message = {"type": "data_changed", "days": None if all_stats else sorted(str(day) for day in stats_days)}
+        self.loop.call_soon_threadsafe(self.queue, None, message)
+
+    async def announce(self, room_id, message):
+        # A message without a timer change, delivered through the log to
+        # the room's clients in every worker
+        self.queue(room_id, message)
+
+    def queue(self, room_id, message):
+        self.outbox.append((room_id, message))
+        self.wakeup.set()
+
+    def exchange(self, outbox):
+        # Runs in a worker thread: write our queued events, then read
+        # whatever the log gained since the last call
+        now = time.time()
+        if outbox:
+            with self.lock:
+                self.writer.executemany(
+                    "INSERT INTO timer_events (room, origin, state, message, created_at) VALUES (?, ?, NULL, ?, ?)",
+                    [(room_id, self.origin, json.dumps(message), now) for room_id, message in outbox]
+                )
+        data_version = self.reader.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return []
+        self.data_version = data_version
+        rows = self.reader.execute(
+            "SELECT seq, room, origin, state, message FROM timer_events WHERE seq > ? ORDER BY seq",
+            (self.last_seq,)
+        ).fetchall()
+        if rows:
+            self.last_seq = rows[-1][0]
+        if time.monotonic() - self.pruned_at > 60:
+            # Every worker has long read events older than a minute
+            self.pruned_at = time.monotonic()
+            with self.lock:
+                self.writer.execute("DELETE FROM timer_events WHERE created_at < ?", (now - 60,))
+        return rows
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            outbox, self.outbox = self.outbox, []
+            try:
+                rows = await asyncio.to_thread(self.exchange, outbox)
+            except sqlite3.Error as exc:
+                logger.warning("Timer event log error: %s", exc)
+                continue
+            for _, room_id, origin, state, message in rows:
+                message = json.loads(message)
+                if room_id is None:
+                    if origin != self.origin:
+                        apply_data_changed(message)
+                    continue
+                room = rooms.get(room_id)
+                if room is None:
+                    # Loaded from timer_rooms once a client asks for it
+                    continue
+                if state is not None:
+                    snapshot = json.loads(state)
+                    if snapshot["version"] > room.timer.version:
+                        room.timer.restore(snapshot)
+                await broadcast(room, message)
+
+    async def start(self):
+        self.open()
+        # Load running timers so their deadlines fire even before a client
+        # asks for the room
+        with self.lock:
+            rows = self.writer.execute("SELECT room, state FROM timer_rooms").fetchall()
+        for room_id, state in rows:
+            state = json.loads(state)
+            if state["is_running"] and room_id not in rooms:
+                room = rooms[room_id] = Room(room_id)
+                room.timer.restore(state)
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.loop = None
+        for conn in (self.writer, self.reader):
+            if conn is not None:
+                conn.close()
+        self.writer = self.reader = None
+
+if TIMER_BACKEND == "sqlite":
+    # timer_rooms already keeps the state durable
+    timer_backend = SQLiteTimerBackend(BUS_PATH, BUS_POLL_MS / 1000)
+else:
+    timer_backend = LocalTimerBackend(TimerJournal(TIMER_JOURNAL, TIMER_SNAPSHOT_EVERY) if TIMER_JOURNAL else None)
+
+# Every running timer has exactly one live (wake_at, seq, room) entry in a
+# shared heap; entries whose wake_at no longer matches the room are stale
+# and skipped when popped
+timer_heap = []
+timer_heap_seq = itertools.count()
+# Wakes timer_background_task; created by startup_event on the serving loop
+timer_heap_changed = None
+timer_task = None
+
+def schedule_timer(room):
+    timer = room.timer
+    if not timer.is_running:
+        room.wake_at = None
+        return
+
+    wake_at = timer.deadline
+    remaining = timer.deadline - time.monotonic()
+    if remaining > 0 and room.has_legacy_clients():
+        # Wake on the next whole second before the deadline so that ticks
+        # line up with the displayed time_left
+        wake_at = timer.deadline - (math.ceil(remaining) - 1)
+    if wake_at == room.wake_at:
+        return
+
+    room.wake_at = wake_at
+    heapq.heappush(timer_heap, (wake_at, next(timer_heap_seq), room))
+    if len(timer_heap) > 2 * len(rooms) + 64:
+        # Drop stale entries left behind by pause/start churn
+        timer_heap[:] = [entry for entry in timer_heap if entry[2].wake_at == entry[0]]
+        heapq.heapify(timer_heap)
+    if timer_heap[0][2] is room and timer_heap_changed is not None:
+        timer_heap_changed.set()
+
+# Seconds before a room whose timer failed to complete is tried again
+TIMER_RETRY_SECONDS = 1.0
+
+def retry_timer(room):
+    if not room.timer.is_running:
+        return
+    room.wake_at = time.monotonic() + TIMER_RETRY_SECONDS
+    heapq.heappush(timer_heap, (room.wake_at, next(timer_heap_seq), room))
+
+# Background task for timers
 async def timer_background_task():
     while True:
-        await asyncio.sleep(1)
+        timer_heap_changed.clear()
 
-        if timer_state.is_running and timer_state.time_left > 0:
-            timer_state.time_left -= 1
+        now = time.monotonic()
+        while timer_heap and timer_heap[0][0] <= now:
+            wake_at, _, room = heapq.heappop(timer_heap)
+            if room.wake_at != wake_at:
+                continue
+            room.wake_at = None
+            timer_loop_lag.observe(now - wake_at)
 
-            # Notify all connected clients
-            for connection in active_connections:
-                try:
-                    await connection.send_json({
-                        "type": "timer_update",
-                        "data": timer_state.to_dict()
-                    })
-                except:
-                    # Remove disconnected clients
-                    if connection in active_connections:
-                        active_connections.remove(connection)
-
-            # Timer completed
-            if timer_state.time_left == 0:
-                timer_state.is_running = False
-
-                # Notify completion
-                for connection in active_connections:
-                    try:
-                        await connection.send_json({
-                            "type": "timer_complete",
-                            "is_work_time": timer_state.is_work_time
-                        })
-                    except:
-                        if connection in active_connections:
-                            active_connections.remove(connection)
-
-                # Switch mode
-                if timer_state.is_work_time:
-                    # Add completed pomodoro to database
-                    if timer_state.current_task_id:
-                        db = SessionLocal()
-                        try:
-                            db_pomodoro = Pomodoro(
-                                task_id=timer_state.current_task_id,
-                                duration=timer_state.work_duration // 60
-                            )
-                            db.add(db_pomodoro)
-                            db.commit()
-                        finally:
-                            db.close()
-
-                    # Switch to break time
-                    timer_state.is_work_time = False
-                    timer_state.time_left = timer_state.break_duration
+            try:
+                if now >= room.timer.deadline:
+                    await complete_timer(room)
                 else:
-                    # Switch to work time
-                    timer_state.is_work_time = True
-                    timer_state.time_left = timer_state.work_duration
+                    # Per-second ticks are only needed by legacy clients
+                    await broadcast(room, {
+                        "type": "timer_update",
+                        "data": room.timer.to_dict()
+                    }, protocol=LEGACY_PROTOCOL)
+                    schedule_timer(room)
+            except Exception:
+                # E.g. the bus database stayed locked; the other rooms carry
+                # on and this one is tried again
+                logger.exception("Timer of room %s failed", room.id)
+                retry_timer(room)
 
-                # Notify mode change
-                for connection in active_connections:
-                    try:
-                        await connection.send_json({
-                            "type": "mode_change",
-                            "is_work_time": timer_state.is_work_time
-                        })
-                    except:
-                        if connection in active_connections:
-                            active_connections.remove(connection)
+        # Sleep until the earliest deadline, or until a command moves it
+        delay = timer_heap[0][0] - time.monotonic() if timer_heap else None
+        try:
+            await asyncio.wait_for(timer_heap_changed.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+def complete_due_timer(timer):
+    # A no-op unless the deadline has passed, so that when several workers
+    # wake up for the same deadline only the first one completes it. Work is
+    # followed by a break and a break by work; the switch is part of the same
+    # change so that no command can land between completion and reset.
+    if not timer.is_running or timer.deadline > time.monotonic():
+        return []
+    completed_work = timer.is_work_time
+    timer.pause()
+    completed = {
+        "type": "timer_complete",
+        "is_work_time": completed_work,
+        "data": timer.to_dict()
+    }
+    timer.reset(not completed_work)
+    return [completed, {
+        "type": "mode_change",
+        "is_work_time": timer.is_work_time,
+        "data": timer.to_dict()
+    }]
+
+async def complete_timer(room):
+    # Notify completion and the mode change, the pomodoro is written
+    # afterwards off the timer loop
+    messages = await update_timer(room, complete_due_timer)
+    if not messages:
+        return
+    completed = messages[0]
+    if completed["is_work_time"] and completed["data"]["current_task_id"]:
+        record_completed_pomodoro(
+            room.id, completed["data"]["current_task_id"], completed["data"]["work_duration"] // 60
+        )
 
 # FastAPI app
-app = FastAPI(title="Pomodoro Tracker API")
+app = FastAPI(title="Pomodoro Tracker API", default_response_class=APIResponse)
 
-# Serve static files
-app.mount("/static", StaticFiles(directory="."), name="static")
+app.add_middleware(MetricsMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -186,64 +1457,151 @@ def get_db():
     finally:
         db.close()
 
+# Versions restart with the process, so tags from a previous run never match
+ETAG_PREFIX = uuid.uuid4().hex[:12]
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_connections.append(websocket)
+    try:
+        protocol = int(websocket.query_params.get("protocol", LEGACY_PROTOCOL))
+    except ValueError:
+        protocol = LEGACY_PROTOCOL
+    protocol = min(max(protocol, LEGACY_PROTOCOL), PROTOCOL_VERSION)
+    binary = websocket.query_params.get("format") == "binary"
+    room = await get_room(websocket.query_params.get("room", DEFAULT_ROOM))
+    timer = room.timer
+    client = ClientConnection(websocket, room, protocol, binary)
+    active_connections.add(client)
+    room.connections.add(client)
+    # Let a running timer start ticking for a new legacy client
+    schedule_timer(room)
     try:
         # Send current state on connection
-        await websocket.send_json({
+        send_message(client, {
             "type": "initial_state",
-            "timer": timer_state.to_dict()
+            "protocol": protocol,
+            "format": "binary" if binary else "json",
+            "timer": timer.to_dict()
         })
 
         while True:
             data = await websocket.receive_json()
 
             # Handle different commands
+            change = None
             if data.get("type") == "start_timer":
-                timer_state.is_running = True
+                change = transition("start", TimerState.start)
             elif data.get("type") == "pause_timer":
-                timer_state.is_running = False
+                change = transition("pause", TimerState.pause)
             elif data.get("type") == "skip_timer":
-                timer_state.is_running = False
-                timer_state.is_work_time = not timer_state.is_work_time
-                timer_state.time_left = (
-                    timer_state.break_duration
-                    if timer_state.is_work_time
-                    else timer_state.work_duration
-                )
+                change = transition("skip", TimerState.skip)
             elif data.get("type") == "update_settings":
-                timer_state.work_duration = data.get("work_duration", 1500)
-                timer_state.break_duration = data.get("break_duration", 300)
-                timer_state.time_left = (
-                    timer_state.work_duration
-                    if timer_state.is_work_time
-                    else timer_state.break_duration
+                work_duration = data.get("work_duration", 1500)
+                break_duration = data.get("break_duration", 300)
+                change = transition(
+                    "settings", lambda timer: timer.update_settings(work_duration, break_duration)
                 )
             elif data.get("type") == "set_task":
-                timer_state.current_task_id = data.get("task_id")
+                task_id = data.get("task_id")
+                change = transition("task", lambda timer: timer.set_task(task_id))
 
             # Broadcast new state to all clients
-            for connection in active_connections:
-                try:
-                    await connection.send_json({
-                        "type": "timer_update",
-                        "data": timer_state.to_dict()
-                    })
-                except:
-                    if connection in active_connections:
-                        active_connections.remove(connection)
+            if change:
+                await update_timer(room, change)
 
     except WebSocketDisconnect:
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+        pass
+    finally:
+        active_connections.discard(client)
+        room.connections.discard(client)
+        client.closed = True
+        client.writer.cancel()
+        release_room(room)
 
 # Serve the frontend
+# Frontend files, by URL path. Nothing outside this manifest is served.
+FRONTEND_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_MANIFEST = {
+    "/": ("index.html", "text/html; charset=utf-8"),
+    "/index.html": ("index.html", "text/html; charset=utf-8"),
+}
+# index.html is not fingerprinted, so browsers revalidate it on every load
+STATIC_CACHE_CONTROL = "no-cache"
+
+class StaticAsset:
+    # A file read once, with its precompressed variants and their strong
+    # ETags keyed by content coding
+    def __init__(self, path, content_type):
+        with open(path, "rb") as f:
+            body = f.read()
+        self.content_type = content_type
+        self.variants = {"identity": body}
+        self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+            for coding in self.variants
+        }
+
+    def response(self, request: Request) -> Response:
+        coding = preferred_coding(request.headers.get("accept-encoding", ""), self.variants)
+        headers = {
+            "ETag": self.etags[coding],
+            "Cache-Control": STATIC_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        if etag_matches(request, self.etags[coding]):
+            return Response(status_code=304, headers=headers)
+        return Response(self.variants[coding], media_type=self.content_type, headers=headers)
+
+def preferred_coding(accept_encoding, variants):
+    # Smallest variant the client accepts: brotli, then gzip
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    for coding in ("br", "gzip"):
+        if coding in variants and (coding in accepted or "*" in accepted):
+            return coding
+    return "identity"
+
+static_assets = {}
+
+def load_static_assets():
+    loaded = {}
+    for url_path, (file_name, content_type) in STATIC_MANIFEST.items():
+        if file_name not in loaded:
+            loaded[file_name] = StaticAsset(os.path.join(FRONTEND_DIR, file_name), content_type)
+        static_assets[url_path] = loaded[file_name]
+
 @app.get("/")
-async def read_index():
-    return FileResponse("index.html")
+async def read_index(request: Request):
+    return static_assets["/"].response(request)
 
 # API endpoints
 @app.post("/api/tasks/", response_model=TaskResponse)
@@ -251,13 +1609,25 @@ def create_task(task: TaskCreate, db: Session = Depends(get_db)):
     db_task = Task(**task.dict())
     db.add(db_task)
     db.commit()
-    db.refresh(db_task)
-    return task_response_with_stats(db_task, db)
+    task = task_response_with_stats(db_task.id, db)
+    task_cache.put_task(task)
+    timer_backend.data_changed()
+    return task
 
 @app.get("/api/tasks/", response_model=List[TaskResponse])
-def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    tasks = db.query(Task).filter(Task.is_active == True).offset(skip).limit(limit).all()
-    return [task_response_with_stats(task, db) for task in tasks]
+def read_tasks(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    # completed_today depends on the date, so it is part of the tag. The
+    # session only connects once queried, neither a 304 nor a cache hit
+    # touches the database.
+    etag = f'W/"{ETAG_PREFIX}-tasks-{task_cache.version}-{datetime.now().date()}-{skip}-{limit}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    tasks = task_cache.get(db)[max(skip, 0):]
+    if limit >= 0:
+        tasks = tasks[:limit]
+    # The cached rows already have the TaskResponse fields, they are encoded
+    # as they are instead of being validated into models first
+    return APIResponse(tasks, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.put("/api/tasks/{task_id}", response_model=TaskResponse)
 def update_task(task_id: int, task: TaskCreate, db: Session = Depends(get_db)):
@@ -267,8 +1637,12 @@ def update_task(task_id: int, task: TaskCreate, db: Session = Depends(get_db)):
     for key, value in task.dict().items():
         setattr(db_task, key, value)
     db.commit()
-    db.refresh(db_task)
-    return task_response_with_stats(db_task, db)
+    task = task_response_with_stats(task_id, db)
+    task_cache.put_task(task)
+    # Stats are reported by task name
+    stats_cache.clear()
+    timer_backend.data_changed(all_stats=True)
+    return task
 
 @app.delete("/api/tasks/{task_id}")
 def delete_task(task_id: int, db: Session = Depends(get_db)):
@@ -277,41 +1651,44 @@ def delete_task(task_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Task not found")
     db_task.is_active = False
     db.commit()
+    task_cache.remove_task(task_id)
+    timer_backend.data_changed()
     return {"message": "Task deleted successfully"}
 
 @app.post("/api/pomodoros/", response_model=PomodoroResponse)
-def create_pomodoro(pomodoro: PomodoroCreate, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == pomodoro.task_id, Task.is_active == True).first()
-    if not task:
+async def create_pomodoro(pomodoro: PomodoroCreate):
+    # The lookup session is closed before the insert so that a request never
+    # holds two pooled connections at once
+    async with AsyncSessionLocal() as db:
+        task_id = await db.scalar(
+            select(Task.id).where(Task.id == pomodoro.task_id, Task.is_active == True)
+        )
+    if not task_id:
         raise HTTPException(status_code=404, detail="Task not found")
-    db_pomodoro = Pomodoro(**pomodoro.dict())
-    db.add(db_pomodoro)
-    db.commit()
-    db.refresh(db_pomodoro)
-    return db_pomodoro
+    return await save_pomodoro(pomodoro.task_id, pomodoro.duration)
 
 @app.get("/api/stats/daily/")
 def get_daily_stats(start_date: date, end_date: Optional[date] = None, db: Session = Depends(get_db)):
     if not end_date:
         end_date = start_date
+    return stats_cache.get(start_date, end_date, lambda: daily_stats(db, start_date, end_date))
+
+def daily_stats(db: Session, start_date: date, end_date: date) -> Dict[str, Any]:
     result = {}
     current_date = start_date
     while current_date <= end_date:
-        day_start = datetime.combine(current_date, datetime.min.time())
-        day_end = datetime.combine(current_date, datetime.max.time())
-        pomodoros = db.query(Pomodoro).filter(
-            Pomodoro.completed_at >= day_start,
-            Pomodoro.completed_at <= day_end
-        ).all()
-        task_counts = {}
-        for pomodoro in pomodoros:
-            task_name = pomodoro.task.name
-            task_counts[task_name] = task_counts.get(task_name, 0) + 1
         result[str(current_date)] = {
-            "completed": len(pomodoros),
-            "tasks": task_counts
+            "completed": 0,
+            "tasks": {}
         }
         current_date += timedelta(days=1)
+
+    rows = daily_stats_query(db, start_date, end_date).all()
+    for day, task_name, count in rows:
+        day_stats = result[str(day)]
+        day_stats["completed"] += count
+        if task_name is not None:
+            day_stats["tasks"][task_name] = day_stats["tasks"].get(task_name, 0) + count
     return result
 
 @app.get("/api/stats/monthly/")
@@ -323,76 +1700,197 @@ def get_monthly_stats(year: int, month: int, db: Session = Depends(get_db)):
         end_date = date(year, month + 1, 1) - timedelta(days=1)
     return get_daily_stats(start_date, end_date, db)
 
+@app.get("/metrics")
+def get_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/")
+def get_cache_stats():
+    # Hit and miss counters of the in-process caches
+    return {"tasks": task_cache.stats(), "stats": stats_cache.stats()}
+
+METRICS = [
+    timer_loop_lag,
+    broadcast_duration,
+    ws_send_failures,
+    CallbackMetric("pomodoro_active_connections", "Open WebSocket connections", lambda: len(active_connections)),
+    CallbackMetric("pomodoro_rooms", "Timer rooms", lambda: len(rooms)),
+    CallbackMetric("pomodoro_task_cache_hits_total", "Task list cache hits", lambda: task_cache.hits, "counter"),
+    CallbackMetric("pomodoro_task_cache_misses_total", "Task list cache misses", lambda: task_cache.misses, "counter"),
+    CallbackMetric("pomodoro_stats_cache_hits_total", "Stats range cache hits", lambda: stats_cache.hits, "counter"),
+    CallbackMetric("pomodoro_stats_cache_misses_total", "Stats range cache misses", lambda: stats_cache.misses, "counter"),
+    db_query_duration,
+    http_request_duration,
+]
+
+# Timer endpoints are async so that they run on the event loop together
+# with timer_background_task. Every endpoint is scoped to a room.
 @app.get("/api/timer/")
-def get_timer_state():
-    return timer_state.to_dict()
+async def get_timer_state(request: Request, room: str = DEFAULT_ROOM):
+    # The tag follows state changes, not the countdown: clients derive the
+    # remaining time from deadline and server_time. Reading does not create
+    # the room, unknown rooms are answered from the backend's state.
+    if room in rooms:
+        timer = rooms[room].timer
+    else:
+        timer = TimerState()
+        state = await timer_backend.load_state(room)
+        if state is not None:
+            timer.restore(state)
+    etag = f'W/"{ETAG_PREFIX}-timer-{timer.version}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return APIResponse(timer.to_dict(), headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.post("/api/timer/start/")
-def start_timer():
-    timer_state.is_running = True
+async def start_timer(room: str = DEFAULT_ROOM):
+    await update_timer(await get_room(room), transition("start", TimerState.start))
     return {"message": "Timer started"}
 
 @app.post("/api/timer/pause/")
-def pause_timer():
-    timer_state.is_running = False
+async def pause_timer(room: str = DEFAULT_ROOM):
+    await update_timer(await get_room(room), transition("pause", TimerState.pause))
     return {"message": "Timer paused"}
 
 @app.post("/api/timer/skip/")
-def skip_timer():
-    timer_state.is_running = False
-    timer_state.is_work_time = not timer_state.is_work_time
-    timer_state.time_left = (
-        timer_state.break_duration
-        if timer_state.is_work_time
-        else timer_state.work_duration
-    )
+async def skip_timer(room: str = DEFAULT_ROOM):
+    await update_timer(await get_room(room), transition("skip", TimerState.skip))
     return {"message": "Timer skipped"}
 
 @app.put("/api/timer/settings/")
-def update_timer_settings(work_duration: int, break_duration: int):
-    timer_state.work_duration = work_duration * 60
-    timer_state.break_duration = break_duration * 60
-    timer_state.time_left = (
-        timer_state.work_duration
-        if timer_state.is_work_time
-        else timer_state.break_duration
-    )
+async def update_timer_settings(work_duration: int, break_duration: int, room: str = DEFAULT_ROOM):
+    await update_timer(await get_room(room), transition(
+        "settings", lambda timer: timer.update_settings(work_duration * 60, break_duration * 60)
+    ))
     return {"message": "Timer settings updated"}
 
 @app.put("/api/timer/task/{task_id}")
-def set_current_task(task_id: int):
-    timer_state.current_task_id = task_id
+async def set_current_task(task_id: int, room: str = DEFAULT_ROOM):
+    await update_timer(await get_room(room), transition("task", lambda timer: timer.set_task(task_id)))
     return {"message": "Current task updated"}
 
-# Helper function to add stats to task response
-def task_response_with_stats(task: Task, db: Session) -> Dict[str, Any]:
+# Helper functions to add stats to task responses
+def tasks_with_stats_query(db: Session):
+    # Tasks outer-joined to today's pomodoros and grouped per task, so a whole
+    # page of tasks with their completed_today counts is a single query
     today = datetime.now().date()
     today_start = datetime.combine(today, datetime.min.time())
-    completed_today = db.query(Pomodoro).filter(
-        Pomodoro.task_id == task.id,
+    return db.query(
+        Task.id,
+        Task.name,
+        Task.target_pomodoros,
+        Task.color,
+        Task.is_active,
+        func.count(Pomodoro.id).label("completed_today")
+    ).outerjoin(Pomodoro, and_(
+        Pomodoro.task_id == Task.id,
         Pomodoro.completed_at >= today_start
-    ).count()
-    return {
-        "id": task.id,
-        "name": task.name,
-        "target_pomodoros": task.target_pomodoros,
-        "color": task.color,
-        "is_active": task.is_active,
-        "completed_today": completed_today
+    )).group_by(Task.id).order_by(Task.id)
+
+def task_response_with_stats(task_id: int, db: Session) -> Dict[str, Any]:
+    row = tasks_with_stats_query(db).filter(Task.id == task_id).one()
+    return dict(row._mapping)
+
+def daily_stats_query(db: Session, start_date: date, end_date: date):
+    # Precomputed rows from the rollup, one per day and task
+    return db.query(
+        DailyTaskStats.day,
+        Task.name,
+        DailyTaskStats.count
+    ).outerjoin(Task, Task.id == DailyTaskStats.task_id).filter(
+        DailyTaskStats.day >= start_date,
+        DailyTaskStats.day <= end_date
+    )
+
+def explain_query_plan(db: Session, query) -> List[str]:
+    sql = str(query.statement.compile(
+        dialect=db.get_bind().dialect,
+        compile_kwargs={"literal_binds": True}
+    ))
+    return [row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+def check_query_indexes(db: Session) -> Dict[str, List[str]]:
+    # Make sure SQLite picks an index for each of the hot queries
+    today = datetime.now().date()
+    expected = {
+        "ix_pomodoros_task_id_completed_at": tasks_with_stats_query(db).filter(Task.is_active == True),
+        "daily_task_stats USING PRIMARY KEY": daily_stats_query(db, today - timedelta(days=30), today),
     }
+    plans = {}
+    for index_name, query in expected.items():
+        plan = explain_query_plan(db, query)
+        if not any(index_name in step for step in plan):
+            raise RuntimeError(f"Query does not use {index_name}: {plan}")
+        plans[index_name] = plan
+    return plans
 
 # Catch-all route to serve the frontend
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
-    if os.path.exists(full_path) and os.path.isfile(full_path):
-        return FileResponse(full_path)
-    return FileResponse("index.html")
+async def serve_frontend(full_path: str, request: Request):
+    # Manifest entries, and the frontend for any other path it routes itself
+    asset = static_assets.get("/" + full_path, static_assets["/"])
+    return asset.response(request)
 
 # Start background task on app startup
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(timer_background_task())
+    global timer_heap_changed, timer_task
+    load_static_assets()
+    # Events bind to the loop that first waits on them, so they are made per
+    # lifespan rather than at import
+    timer_heap_changed = asyncio.Event()
+    await timer_backend.start()
+    timer_task = asyncio.create_task(timer_background_task())
+    if pomodoro_writer:
+        pomodoro_writer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global timer_task
+    # No completions start once the timer loop is gone
+    if timer_task:
+        timer_task.cancel()
+        try:
+            await timer_task
+        except asyncio.CancelledError:
+            pass
+        timer_task = None
+    # Flush batched pomodoros before the engine goes away; completions
+    # still being written are waited for while the writer runs
+    if background_saves:
+        await asyncio.gather(*background_saves, return_exceptions=True)
+    if pomodoro_writer:
+        await pomodoro_writer.stop()
+    await timer_backend.stop()
+    await async_engine.dispose()
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    import sys
+
+    if sys.argv[1:] == ["check-indexes"]:
+        db = SessionLocal()
+        try:
+            for index_name, plan in check_query_indexes(db).items():
+                print(f"{index_name}: OK")
+                for step in plan:
+                    print(f"    {step}")
+        finally:
+            db.close()
+    elif sys.argv[1:] == ["rebuild-stats"]:
+        db = SessionLocal()
+        try:
+            print(f"daily_task_stats rebuilt: {rebuild_daily_stats(db)} rows")
+        finally:
+            db.close()
+    else:
+        import uvicorn
+        if WORKERS > 1:
+            if TIMER_BACKEND != "sqlite":
+                raise RuntimeError("POMODORO_WORKERS > 1 needs POMODORO_TIMER_BACKEND=sqlite")
+            # Workers import the app themselves
+            uvicorn.run("main:app", host="0.0.0.0", port=8000, log_level="info", workers=WORKERS)
+        else:
+            uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
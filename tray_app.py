@@ -1,5 +1,7 @@
 # tray_app.py
 import sys
+import math
+import time
 import aiohttp
 import asyncio
 import winsound
@@ -10,14 +12,25 @@ from PyQt6.QtWidgets import (QApplication, QSystemTrayIcon, QMenu, QWidget,
 from PyQt6.QtGui import QIcon, QAction
 from PyQt6.QtCore import Qt, QTimer, QSize
 from win10toast import ToastNotifier
+from qasync import QEventLoop, asyncSlot
 import json
 
 class PomodoroTrayApp(QWidget):
     def __init__(self):
         super().__init__()
         self.api_base = "http://localhost:8000/api"
+        # Only transitions are pushed with protocol=2, the countdown is local
+        self.ws_url = "ws://localhost:8000/ws?protocol=2"
+        # One pooled session for every request, created on first use
+        self.session = None
+        self.ws = None
+        # ETag and last body of every GET endpoint
+        self.etag_cache = {}
         self.tasks = []
         self.current_task_id = None
+        self.state = None
+        # Local deadline (time.monotonic) the display counts down to
+        self.local_deadline = None
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_timer)
         self.toaster = ToastNotifier()
@@ -89,7 +102,7 @@ class PomodoroTrayApp(QWidget):
 
         # Refresh button
         self.refresh_btn = QPushButton("Refresh Tasks")
-        self.refresh_btn.clicked.connect(lambda: asyncio.create_task(self.load_data()))
+        self.refresh_btn.clicked.connect(self.refresh_tasks)
         layout.addWidget(self.refresh_btn)
 
         self.setLayout(layout)
@@ -132,32 +145,107 @@ class PomodoroTrayApp(QWidget):
         event.ignore()
         self.hide()
 
-    async def api_request(self, endpoint, method="GET", data=None):
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            # Keep-alive connections are reused across requests and the socket
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=4))
+        return self.session
+
+    async def close_session(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def api_request(self, endpoint, method="GET", data=None, params=None):
+        url = f"{self.api_base}{endpoint}"
+        headers = {}
+        cached = self.etag_cache.get(url) if method == "GET" else None
+        if cached:
+            headers["If-None-Match"] = cached[0]
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    method,
-                    f"{self.api_base}{endpoint}",
-                    json=data
-                ) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        print(f"API error: {response.status}")
-                        return None
+            async with self.get_session().request(
+                method,
+                url,
+                json=data,
+                params=params,
+                headers=headers
+            ) as response:
+                if response.status == 304 and cached:
+                    return cached[1]
+                if response.status == 200:
+                    body = await response.json()
+                    etag = response.headers.get("ETag")
+                    if method == "GET" and etag:
+                        self.etag_cache[url] = (etag, body)
+                    return body
+                else:
+                    print(f"API error: {response.status}")
+                    return None
         except Exception as e:
             print(f"Request error: {e}")
             return None
 
-    async def load_data(self):
-        # Load tasks
+    async def websocket_listener(self):
+        # Apply pushed timer changes, reconnecting with a growing delay
+        delay = 1
+        while True:
+            try:
+                async with self.get_session().ws_connect(self.ws_url, heartbeat=30) as ws:
+                    self.ws = ws
+                    delay = 1
+                    await self.load_tasks()
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            await self.handle_message(json.loads(msg.data))
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket error: {e}")
+            finally:
+                self.ws = None
+            # Keep the display right over REST until the socket is back
+            await self.update_timer_state()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def handle_message(self, message):
+        if message.get("type") == "initial_state":
+            state = message.get("timer")
+        else:
+            state = message.get("data")
+        if state:
+            self.update_ui_from_state(state)
+
+        if message.get("type") == "timer_complete":
+            if message.get("is_work_time"):
+                self.show_notification("Pomodoro complete", "Time for a break!", True)
+            else:
+                self.show_notification("Break is over", "Time to work!")
+        elif message.get("type") == "pomodoro_recorded":
+            # completed_today changed with the stored pomodoro
+            await self.load_tasks()
+
+    async def load_tasks(self):
         tasks = await self.api_request("/tasks/")
-        if tasks:
+        if tasks and tasks is not self.tasks:
             self.tasks = tasks
+            # Refilling the combo box must not send set_task back
+            self.task_combo.blockSignals(True)
             self.task_combo.clear()
             self.task_combo.addItem("No task", None)
             for task in tasks:
                 self.task_combo.addItem(task["name"], task["id"])
+            if self.state and self.state["current_task_id"]:
+                index = self.task_combo.findData(self.state["current_task_id"])
+                if index >= 0:
+                    self.task_combo.setCurrentIndex(index)
+                    self.task_label.setText(self.task_combo.itemText(index))
+            self.task_combo.blockSignals(False)
+
+    async def load_data(self):
+        await self.load_tasks()
 
         # Load timer state
         state = await self.api_request("/timer/")
@@ -165,10 +253,24 @@ class PomodoroTrayApp(QWidget):
             self.update_ui_from_state(state)
 
     def update_ui_from_state(self, state):
+        if state is self.state:
+            # Unchanged (304), keep counting down from the known deadline
+            return
+        # The server only reports transitions, the countdown runs locally
+        self.state = state
+        if state["is_running"]:
+            if state.get("deadline") is not None:
+                remaining = state["deadline"] - state["server_time"]
+            else:
+                remaining = state["time_left"]
+            self.local_deadline = time.monotonic() + remaining
+            self.timer.start(1000)
+        else:
+            self.local_deadline = None
+            self.timer.stop()
+
         # Update timer display
-        minutes = state["time_left"] // 60
-        seconds = state["time_left"] % 60
-        self.timer_label.setText(f"{minutes:02d}:{seconds:02d}")
+        self.render_time_left()
 
         # Update mode
         mode = "Work Time" if state["is_work_time"] else "Break Time"
@@ -186,37 +288,66 @@ class PomodoroTrayApp(QWidget):
                 # Select in combo box
                 index = self.task_combo.findData(state["current_task_id"])
                 if index >= 0:
+                    self.task_combo.blockSignals(True)
                     self.task_combo.setCurrentIndex(index)
+                    self.task_combo.blockSignals(False)
 
     async def update_timer_state(self):
         state = await self.api_request("/timer/")
         if state:
             self.update_ui_from_state(state)
 
-    def update_timer(self):
-        asyncio.create_task(self.update_timer_state())
+    def render_time_left(self):
+        if self.local_deadline is not None:
+            time_left = max(0, math.ceil(self.local_deadline - time.monotonic()))
+        else:
+            time_left = self.state["time_left"] if self.state else 0
+        minutes = time_left // 60
+        seconds = time_left % 60
+        self.timer_label.setText(f"{minutes:02d}:{seconds:02d}")
+        return time_left
 
+    def update_timer(self):
+        if self.render_time_left() == 0:
+            self.timer.stop()
+            # The deadline passed; the socket pushes the next mode, without it
+            # fetch it from the server
+            if self.ws is None:
+                asyncio.create_task(self.update_timer_state())
+
+    @asyncSlot()
+    async def refresh_tasks(self):
+        await self.load_data()
+
+    @asyncSlot()
     async def start_timer(self):
         await self.api_request("/timer/start/", "POST")
-        self.timer.start(1000)  # Update every second
+        if self.ws is None:
+            await self.update_timer_state()
 
+    @asyncSlot()
     async def pause_timer(self):
         await self.api_request("/timer/pause/", "POST")
-        self.timer.stop()
+        if self.ws is None:
+            await self.update_timer_state()
 
+    @asyncSlot()
     async def skip_timer(self):
         await self.api_request("/timer/skip/", "POST")
-        await self.update_timer_state()
+        if self.ws is None:
+            await self.update_timer_state()
 
+    @asyncSlot()
     async def settings_changed(self):
         work_mins = self.work_duration.value()
         break_mins = self.break_duration.value()
         await self.api_request(
             "/timer/settings/",
             "PUT",
-            {"work_duration": work_mins, "break_duration": break_mins}
+            params={"work_duration": work_mins, "break_duration": break_mins}
         )
 
+    @asyncSlot(int)
     async def task_changed(self, index):
         task_id = self.task_combo.itemData(index)
         if task_id:
@@ -244,18 +375,27 @@ class PomodoroTrayApp(QWidget):
         # Flash taskbar icon
         self.tray_icon.showMessage(title, message, QSystemTrayIcon.MessageIcon.Information, 3000)
 
-async def main():
-    app = QApplication(sys.argv)
-    app.setQuitOnLastWindowClosed(False)
+async def main(app):
+    closing = asyncio.Event()
+    app.aboutToQuit.connect(closing.set)
 
     tray_app = PomodoroTrayApp()
     tray_app.show()
 
     # Start WebSocket connection for real-time updates
-    asyncio.create_task(tray_app.websocket_listener())
+    listener = asyncio.create_task(tray_app.websocket_listener())
 
-    # Run the application
-    await asyncio.get_event_loop().run_forever()
+    # Run until the application quits
+    await closing.wait()
+    listener.cancel()
+    await tray_app.close_session()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    app = QApplication(sys.argv)
+    app.setQuitOnLastWindowClosed(False)
+
+    # Qt and asyncio share one event loop
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    with loop:
+        loop.run_until_complete(main(app))
\ No newline at end of file